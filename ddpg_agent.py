@@ -1,7 +1,6 @@
+import importlib.util
 import numpy as np
 import random
-import copy
-from collections import namedtuple, deque
 
 from ddpg_model import Actor, Critic
 
@@ -18,10 +17,24 @@ LR_CRITIC = 5e-5        # learning rate of the critic
 WEIGHT_DECAY = 0.0        # L2 weight decay
 LEARN_N_INTERVAL = 20
 LEARN_N_TIMES = 10
+STORE_ON_GPU = True      # keep the replay buffer resident on the training device
 
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+USE_FUSED_ADAM = device.type == "cuda"  # single-kernel Adam step for all parameters
+# torch.compile on CUDA needs Inductor's Triton backend, which e.g. most Windows installs lack
+USE_TORCH_COMPILE = (device.type == "cuda" and hasattr(torch, "compile")
+                     and importlib.util.find_spec("triton") is not None)
 
 
+def _compute_q_targets(actor_target, critic_target, next_states, rewards, dones, gamma):
+    """Q_targets = r + γ * critic_target(next_state, actor_target(next_state)) * (1 - done)"""
+    Q_targets_next = critic_target(next_states, actor_target(next_states))
+    return rewards + (gamma * Q_targets_next * (1 - dones))
+
+if USE_TORCH_COMPILE:
+    # BATCH_SIZE is fixed, so the target graph is captured once and replayed
+    _compute_q_targets = torch.compile(_compute_q_targets, mode="reduce-overhead")
+
 
 class Agent():
     """Interacts with and learns from the environment."""
@@ -31,13 +44,46 @@ class Agent():
         
             self.actor_local =  Actor(state_size, action_size, random_seed).to(device)
             self.actor_target =  Actor(state_size, action_size, random_seed).to(device)
-            self.actor_optimizer =  optim.Adam(self.actor_local.parameters(), lr=LR_ACTOR)
+            self.actor_optimizer =  optim.Adam(self.actor_local.parameters(), lr=LR_ACTOR, fused=USE_FUSED_ADAM)
 
             # Critic Network (w/ Target Network)
             self.critic_local =   Critic(state_size, action_size, random_seed).to(device)
             self.critic_target =  Critic(state_size, action_size, random_seed).to(device)
-            self.critic_optimizer =  optim.Adam(self.critic_local.parameters(), lr=LR_CRITIC, weight_decay=WEIGHT_DECAY)
-            self.memory = ReplayBuffer(action_size, BUFFER_SIZE, BATCH_SIZE, random_seed)   
+            self.critic_optimizer =  optim.Adam(self.critic_local.parameters(), lr=LR_CRITIC, weight_decay=WEIGHT_DECAY,
+                                            fused=USE_FUSED_ADAM)
+            self.memory = ReplayBuffer(state_size, action_size, BUFFER_SIZE, BATCH_SIZE, random_seed,
+                                       store_on_gpu=STORE_ON_GPU)   
+
+            # learn() uses compiled (CUDA-graphed) views of the local networks; BATCH_SIZE is fixed so
+            # shapes never change. act() and checkpoints keep using the eager modules, and the target
+            # networks are already compiled as part of _compute_q_targets.
+            self.actor_local_train = self.actor_local
+            self.critic_local_train = self.critic_local
+            if USE_TORCH_COMPILE:
+                self.actor_local_train = torch.compile(self.actor_local, mode="reduce-overhead", dynamic=False)
+                self.critic_local_train = torch.compile(self.critic_local, mode="reduce-overhead", dynamic=False)
+
+            # Minibatches for the next learning step, prefetched from a pinned host-side buffer
+            self.next_batches = None
+
+            # Parameter lists for the fused soft update of the target networks
+            self.actor_local_params = list(self.actor_local.parameters())
+            self.actor_target_params = list(self.actor_target.parameters())
+            self.critic_local_params = list(self.critic_local.parameters())
+            self.critic_target_params = list(self.critic_target.parameters())
+
+            # Noise process shared by all agents, one row of OU state each, driven by a single generator
+            self.action_size = action_size
+            self.random_seed = random_seed
+            self.num_agents = 0
+            self.noise = None
+
+        def add_agent(self):
+            """Add a row to the shared noise process for a new agent and return its index."""
+            index = self.num_agents
+            self.num_agents += 1
+            self.noise = OUNoise((self.num_agents, self.action_size), self.random_seed)
+            return index
 
 
     resourcePool = None 
@@ -56,42 +102,80 @@ class Agent():
         self.seed = random.seed(random_seed)
 
 
-        # Noise process
-        self.noise = OUNoise(action_size, random_seed)
         if Agent.resourcePool is None:
             Agent.resourcePool = Agent.AgentResourcePool(state_size, action_size, random_seed)
+        # Noise process: this agent's row of the shared OU state
+        self.noise_index = Agent.resourcePool.add_agent()
            
 
     
     def step(self, time_step, state, action, reward, next_state, done):
         """Save experience in replay memory, and use random sample from buffer to learn."""
+        rp = Agent.resourcePool
+        memory = rp.memory
         # Save experience / reward
-        Agent.resourcePool.memory.add(state, action, reward, next_state, done)
+        memory.add(state, action, reward, next_state, done)
 
         if time_step % LEARN_N_INTERVAL != 0:
             #print('skip timestep ',time_step)
             return
 
         # Learn, if enough samples are available in memory
-        if len(Agent.resourcePool.memory) > BATCH_SIZE:
+        if len(memory) > BATCH_SIZE:
             #print('learning')
+            if rp.next_batches is None:
+                # One gather (and at most one host-to-device copy) for all LEARN_N_TIMES minibatches
+                batches = memory.sample_many(LEARN_N_TIMES)
+            else:
+                batches, rp.next_batches = rp.next_batches, None
             for i in range (LEARN_N_TIMES):
-                experiences = Agent.resourcePool.memory.sample()
+                experiences = tuple(field[i] for field in batches)
                 self.learn(experiences, GAMMA)
+            if memory.pin_memory:
+                # Gather the next step's minibatches on the host and start their asynchronous copy
+                # while this step's updates are still running on the device
+                rp.next_batches = memory.sample_many(LEARN_N_TIMES)
 
     def act(self, state, add_noise=True):
         """Returns actions for given state as per current policy."""
+        rp = Agent.resourcePool
+        actor_local = rp.actor_local
         state = torch.from_numpy(state).float().to(device)
-        Agent.resourcePool.actor_local.eval()
+        actor_local.eval()
         with torch.no_grad():
-            action = Agent.resourcePool.actor_local(state).cpu().data.numpy()
-        Agent.resourcePool.actor_local.train()
-        if add_noise:
-            action += self.noise.sample()
-        return np.clip(action, -1, 1)
+            action = actor_local(state)
+            if add_noise:
+                action.add_(rp.noise.sample(self.noise_index))
+        actor_local.train()
+        return action.clamp_(-1, 1).cpu().numpy()
+
+    @classmethod
+    def act_batch(cls, agents, states, add_noise=True):
+        """Returns actions for all agents with a single forward pass of the shared actor.
+
+        Params
+        ======
+            agents (list[Agent]): consecutively created agents, in the same order as the rows of states
+            states (np.ndarray): (num_agents, state_size) array of current states
+            add_noise (bool): add each agent's exploration noise
+        """
+        rp = cls.resourcePool
+        actor_local = rp.actor_local
+        # The agents' noise rows form one contiguous block of the shared OU state
+        rows = slice(agents[0].noise_index, agents[0].noise_index + len(agents))
+        if any(agent.noise_index != rows.start + i for i, agent in enumerate(agents)):
+            raise ValueError("act_batch expects agents in the order they were created")
+        states = torch.from_numpy(states).float().to(device)
+        actor_local.eval()
+        with torch.no_grad():
+            actions = actor_local(states)
+            if add_noise:
+                actions.add_(rp.noise.sample(rows))
+        actor_local.train()
+        return actions.clamp_(-1, 1).cpu().numpy()
 
     def reset(self):
-        self.noise.reset()
+        Agent.resourcePool.noise.reset(self.noise_index)
 
     def learn(self, experiences, gamma):
         """Update policy and value parameters using given batch of experience tuples.
@@ -106,102 +190,198 @@ class Agent():
             gamma (float): discount factor
         """
         states, actions, rewards, next_states, dones = experiences
+        rp = Agent.resourcePool
+        actor_t, actor_l = rp.actor_target, rp.actor_local_train
+        critic_t, critic_l = rp.critic_target, rp.critic_local_train
+        c_opt, a_opt = rp.critic_optimizer, rp.actor_optimizer
 
         # ---------------------------- update critic ---------------------------- #
-        # Get predicted next-state actions and Q values from target models
-        actions_next = Agent.resourcePool.actor_target(next_states)
-        Q_targets_next = Agent.resourcePool.critic_target(next_states, actions_next)
-        # Compute Q targets for current states (y_i)
-        Q_targets = rewards + (gamma * Q_targets_next * (1 - dones))
+        # Compute Q targets for current states (y_i) from target models; no graph is kept
+        with torch.no_grad():
+            Q_targets = _compute_q_targets(actor_t, critic_t, next_states, rewards, dones, gamma)
         # Compute critic loss
-        Q_expected = Agent.resourcePool.critic_local(states, actions)
+        Q_expected = critic_l(states, actions)
         critic_loss = F.mse_loss(Q_expected, Q_targets)
         # Minimize the loss
-        Agent.resourcePool.critic_optimizer.zero_grad()
+        c_opt.zero_grad(set_to_none=True)
         critic_loss.backward()
-        Agent.resourcePool.critic_optimizer.step()
+        c_opt.step()
 
         # ---------------------------- update actor ---------------------------- #
         # Compute actor loss
-        actions_pred = Agent.resourcePool.actor_local(states)
-        actor_loss = -Agent.resourcePool.critic_local(states, actions_pred).mean()
-        # Minimize the loss
-        Agent.resourcePool.actor_optimizer.zero_grad()
-        actor_loss.backward()
-        Agent.resourcePool.actor_optimizer.step()
+        actions_pred = actor_l(states)
+        actor_loss = -critic_l(states, actions_pred).mean()
+        # Minimize the loss; gradients are only needed for the actor, not the critic
+        a_opt.zero_grad(set_to_none=True)
+        actor_loss.backward(inputs=rp.actor_local_params)
+        a_opt.step()
 
         # ----------------------- update target networks ----------------------- #
-        self.soft_update(Agent.resourcePool.critic_local, Agent.resourcePool.critic_target, TAU)
-        self.soft_update(Agent.resourcePool.actor_local, Agent.resourcePool.actor_target, TAU)                     
+        self.soft_update(rp.critic_local_params, rp.critic_target_params, TAU)
+        self.soft_update(rp.actor_local_params, rp.actor_target_params, TAU)
 
-    def soft_update(self, local_model, target_model, tau):
+    @torch.no_grad()
+    def soft_update(self, local_params, target_params, tau):
         """Soft update model parameters.
         θ_target = τ*θ_local + (1 - τ)*θ_target
 
         Params
         ======
-            local_model: PyTorch model (weights will be copied from)
-            target_model: PyTorch model (weights will be copied to)
+            local_params (list[torch.Tensor]): parameters of the local model (weights will be copied from)
+            target_params (list[torch.Tensor]): parameters of the target model (weights will be copied to)
             tau (float): interpolation parameter 
         """
-        for target_param, local_param in zip(target_model.parameters(), local_model.parameters()):
-            target_param.data.copy_(tau*local_param.data + (1.0-tau)*target_param.data)
+        torch._foreach_lerp_(target_params, local_params, tau)
 
 class OUNoise:
     """Ornstein-Uhlenbeck process."""
 
     def __init__(self, size, seed, mu=0., theta=0.15, sigma=0.2):
-        """Initialize parameters and noise process."""
-        self.mu = mu * np.ones(size)
+        """Initialize parameters and noise process.
+
+        Params
+        ======
+            size (int or tuple): shape of the noise, e.g. (num_agents, action_size) for one process per agent
+            seed (int): random seed
+        """
+        self.mu = torch.full(size if isinstance(size, tuple) else (size,), mu, device=device)
+        self.state = torch.empty_like(self.mu)
         self.theta = theta
         self.sigma = sigma
-        self.seed = random.seed(seed)
+        self.gen = torch.Generator(device=device)
+        self.gen.manual_seed(seed)
+        self._noise_buf = torch.empty_like(self.mu)
         self.reset()
 
-    def reset(self):
-        """Reset the internal state (= noise) to mean (mu)."""
-        self.state = copy.copy(self.mu)
-
-    def sample(self):
-        """Update internal state and return it as a noise sample."""
-        x = self.state
-        dx = self.theta * (self.mu - x) + self.sigma * np.array([random.random() for i in range(len(x))])
-        self.state = x + dx
-        return self.state
+    def reset(self, index=None):
+        """Reset the internal state (= noise) to mean (mu), only the row(s) at index if given."""
+        state, mu = self.state, self.mu
+        if index is not None:
+            state, mu = state[index], mu[index]
+        state.copy_(mu)
+
+    def sample(self, index=None):
+        """Update internal state in place and return it as a noise sample, only the row(s) at index if given."""
+        state, mu, noise = self.state, self.mu, self._noise_buf
+        if index is not None:
+            state, mu, noise = state[index], mu[index], noise[index]
+        torch.randn(noise.shape, generator=self.gen, device=device, out=noise)
+        # x += θ * (μ - x) + σ * N(0, 1)
+        state.lerp_(mu, self.theta).add_(noise, alpha=self.sigma)
+        return state
 
 class ReplayBuffer:
-    """Fixed-size buffer to store experience tuples."""
+    """Fixed-size ring buffer storing experience fields in preallocated tensors."""
 
-    def __init__(self, action_size, buffer_size, batch_size, seed):
+    def __init__(self, state_size, action_size, buffer_size, batch_size, seed, store_on_gpu=False,
+                 pending_size=1024):
         """Initialize a ReplayBuffer object.
         Params
         ======
+            state_size (int): dimension of each state
+            action_size (int): dimension of each action
             buffer_size (int): maximum size of buffer
             batch_size (int): size of each training batch
+            store_on_gpu (bool): keep the buffer resident on the training device
+            pending_size (int): number of added experiences staged on the host before they are flushed
         """
         self.action_size = action_size
-        self.memory = deque(maxlen=buffer_size)  # internal memory (deque)
+        self.buffer_size = buffer_size
         self.batch_size = batch_size
-        self.experience = namedtuple("Experience", field_names=["state", "action", "reward", "next_state", "done"])
-        self.seed = random.seed(seed)
+        self.store_device = device if store_on_gpu else torch.device("cpu")
+        # A host-side buffer feeding a GPU is page-locked so minibatches can be copied asynchronously
+        self.pin_memory = self.store_device.type == "cpu" and device.type == "cuda"
+        self.states = self._empty((buffer_size, state_size), torch.float32)
+        self.actions = self._empty((buffer_size, action_size), torch.float32)
+        self.rewards = self._empty((buffer_size, 1), torch.float32)
+        self.next_states = self._empty((buffer_size, state_size), torch.float32)
+        self.dones = self._empty((buffer_size, 1), torch.float32)
+        self.ptr = 0   # next write position
+        self.size = 0  # number of valid entries
+        # add() writes rows on the host; flush() moves them into the buffer with one copy per field
+        pending_size = min(pending_size, buffer_size)
+        self.pending = tuple(np.empty((pending_size,) + tuple(field.shape[1:]), dtype=np.float32)
+                             for field in self._fields())
+        self.n_pending = 0
+        self.generator = torch.Generator(device=self.store_device)
+        self.generator.manual_seed(seed)
+        if self.pin_memory:
+            self.staging = tuple(self._empty((batch_size,) + field.shape[1:], field.dtype) for field in self._fields())
+            self.copy_stream = torch.cuda.Stream()
+            self.copy_event = torch.cuda.Event()
+
+    def _empty(self, shape, dtype):
+        return torch.empty(shape, dtype=dtype, device=self.store_device, pin_memory=self.pin_memory)
+
+    def _fields(self):
+        return (self.states, self.actions, self.rewards, self.next_states, self.dones)
     
     def add(self, state, action, reward, next_state, done):
-        """Add a new experience to memory."""
-        e = self.experience(state, action, reward, next_state, done)
-        self.memory.append(e)
+        """Add a new experience to memory, overwriting the oldest once full."""
+        states, actions, rewards, next_states, dones = self.pending
+        row = self.n_pending
+        states[row] = state
+        actions[row] = action
+        rewards[row] = reward
+        next_states[row] = next_state
+        dones[row] = done
+        self.n_pending += 1
+        if self.n_pending == len(states):
+            self.flush()
+
+    def flush(self):
+        """Copy the experiences staged by add() into the ring buffer."""
+        n = self.n_pending
+        if n == 0:
+            return
+        head = min(n, self.buffer_size - self.ptr)
+        for field, pending in zip(self._fields(), self.pending):
+            rows = torch.from_numpy(pending[:n])
+            field[self.ptr:self.ptr + head].copy_(rows[:head])
+            if head < n:
+                # Wrap around to the start of the ring
+                field[:n - head].copy_(rows[head:])
+        self.ptr = (self.ptr + n) % self.buffer_size
+        self.size = min(self.size + n, self.buffer_size)
+        self.n_pending = 0
     
     def sample(self):
         """Randomly sample a batch of experiences from memory."""
-        experiences = random.sample(self.memory, k=self.batch_size)
+        return tuple(field[0] for field in self.sample_many(1))
 
-        states = torch.from_numpy(np.vstack([e.state for e in experiences if e is not None])).float().to(device)
-        actions = torch.from_numpy(np.vstack([e.action for e in experiences if e is not None])).float().to(device)
-        rewards = torch.from_numpy(np.vstack([e.reward for e in experiences if e is not None])).float().to(device)
-        next_states = torch.from_numpy(np.vstack([e.next_state for e in experiences if e is not None])).float().to(device)
-        dones = torch.from_numpy(np.vstack([e.done for e in experiences if e is not None]).astype(np.uint8)).float().to(device)
+    def sample_many(self, n):
+        """Randomly sample n batches of experiences from memory in a single gather.
 
-        return (states, actions, rewards, next_states, dones)
+        Returns a tuple of (s, a, r, s', done) tensors shaped (n, batch_size, dim).
+        """
+        self.flush()
+        idx = torch.randint(0, self.size, (n * self.batch_size,), device=self.store_device, generator=self.generator)
+
+        if self.pin_memory:
+            batch = self._copy_pinned(idx)
+        else:
+            batch = [field.index_select(0, idx).to(device) for field in self._fields()]
+        return tuple(field.view(n, self.batch_size, -1) for field in batch)
+
+    def _copy_pinned(self, idx):
+        """Gather into pinned staging buffers and copy them to the device on a side stream."""
+        # The previous minibatch may still be in flight from the staging buffers
+        self.copy_event.synchronize()
+        # Pinned allocation is expensive: staging only grows, and smaller requests use a prefix of it
+        if self.staging[0].shape[0] < len(idx):
+            self.staging = tuple(self._empty((len(idx),) + field.shape[1:], field.dtype) for field in self._fields())
+        staged = [staging[:len(idx)] for staging in self.staging]
+        for field, staging in zip(self._fields(), staged):
+            torch.index_select(field, 0, idx, out=staging)
+        with torch.cuda.stream(self.copy_stream):
+            batch = [staging.to(device, non_blocking=True) for staging in staged]
+            self.copy_event.record()
+        current_stream = torch.cuda.current_stream()
+        current_stream.wait_stream(self.copy_stream)
+        for tensor in batch:
+            tensor.record_stream(current_stream)
+        return batch
 
     def __len__(self):
         """Return the current size of internal memory."""
-        return len(self.memory)
+        return min(self.size + self.n_pending, self.buffer_size)
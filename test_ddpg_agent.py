@@ -0,0 +1,129 @@
+"""Tests for the DDPG agent, replay buffer and noise process."""
+import numpy as np
+import pytest
+import torch
+
+import ddpg_agent
+from ddpg_agent import Agent, OUNoise, ReplayBuffer
+
+STATE_SIZE = 33
+ACTION_SIZE = 4
+NUM_AGENTS = 20
+
+
+def make_agents(monkeypatch, store_on_gpu=True):
+    """Build NUM_AGENTS agents around a fresh resource pool with a small replay buffer."""
+    monkeypatch.setattr(Agent, "resourcePool", None)
+    monkeypatch.setattr(ddpg_agent, "BUFFER_SIZE", 4096)
+    monkeypatch.setattr(ddpg_agent, "STORE_ON_GPU", store_on_gpu)
+    return [Agent(STATE_SIZE, ACTION_SIZE, random_seed=0) for _ in range(NUM_AGENTS)]
+
+
+@pytest.mark.parametrize("store_on_gpu", [True, False])
+def test_step_learns_past_batch_size(monkeypatch, store_on_gpu):
+    agents = make_agents(monkeypatch, store_on_gpu)
+    pool = Agent.resourcePool
+    actor_before = [p.detach().clone() for p in pool.actor_local_params]
+    critic_target_before = [p.detach().clone() for p in pool.critic_target_params]
+
+    rng = np.random.default_rng(0)
+    states = rng.standard_normal((NUM_AGENTS, STATE_SIZE))
+    # Long enough for two learning steps once the buffer holds more than BATCH_SIZE
+    # experiences, so with a pinned buffer the second one consumes the prefetched minibatches
+    n_steps = ddpg_agent.BATCH_SIZE // NUM_AGENTS + 2 * ddpg_agent.LEARN_N_INTERVAL + 1
+    for t in range(n_steps):
+        actions = Agent.act_batch(agents, states)
+        next_states = rng.standard_normal((NUM_AGENTS, STATE_SIZE))
+        rewards = rng.uniform(0, 0.1, NUM_AGENTS)
+        dones = np.zeros(NUM_AGENTS, dtype=bool)
+        for i, agent in enumerate(agents):
+            agent.step(t, states[i], actions[i], rewards[i], next_states[i], dones[i])
+        states = next_states
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+
+    assert actions.shape == (NUM_AGENTS, ACTION_SIZE)
+    assert np.all(np.abs(actions) <= 1)
+    assert len(pool.memory) == n_steps * NUM_AGENTS
+    assert any(not torch.equal(b, a) for b, a in zip(actor_before, pool.actor_local_params))
+    assert any(not torch.equal(b, a) for b, a in zip(critic_target_before, pool.critic_target_params))
+    for param in pool.actor_local_params + pool.critic_local_params:
+        assert torch.isfinite(param).all()
+    # Only a pinned host-side buffer, i.e. a CPU buffer feeding a GPU, prefetches minibatches
+    assert (pool.next_batches is not None) == pool.memory.pin_memory
+    assert pool.memory.pin_memory == (torch.cuda.is_available() and not store_on_gpu)
+
+
+def test_act_batch_rejects_agents_out_of_order(monkeypatch):
+    agents = make_agents(monkeypatch)
+    states = np.zeros((NUM_AGENTS, STATE_SIZE))
+    with pytest.raises(ValueError):
+        Agent.act_batch(agents[::-1], states)
+
+
+def test_soft_update_interpolates_towards_local(monkeypatch):
+    agent = make_agents(monkeypatch)[0]
+    local = [torch.randn(3, 2), torch.randn(5)]
+    target = [torch.randn(3, 2), torch.randn(5)]
+    expected = [0.1 * l + 0.9 * t for l, t in zip(local, target)]
+    agent.soft_update(local, target, 0.1)
+    for t, e in zip(target, expected):
+        assert torch.allclose(t, e)
+
+
+def test_ou_noise_reset_touches_only_that_row():
+    noise = OUNoise((3, ACTION_SIZE), seed=0)
+    noise.sample()
+    before = noise.state.clone()
+    noise.reset(1)
+    assert torch.equal(noise.state[1], noise.mu[1])
+    assert torch.equal(noise.state[0], before[0])
+    assert torch.equal(noise.state[2], before[2])
+
+
+def test_replay_buffer_sample_many_shapes_and_dones():
+    memory = ReplayBuffer(STATE_SIZE, ACTION_SIZE, 64, batch_size=4, seed=0)
+    for k in range(20):
+        memory.add(np.zeros(STATE_SIZE), np.zeros(ACTION_SIZE), 0.0, np.zeros(STATE_SIZE), k % 2 == 0)
+
+    states, actions, rewards, next_states, dones = memory.sample_many(3)
+    assert states.shape == (3, 4, STATE_SIZE)
+    assert actions.shape == (3, 4, ACTION_SIZE)
+    assert rewards.shape == (3, 4, 1)
+    assert next_states.shape == (3, 4, STATE_SIZE)
+    assert dones.shape == (3, 4, 1)
+    assert dones.dtype == torch.float32
+    assert set(dones.flatten().tolist()) <= {0.0, 1.0}
+
+
+e(param).all()
+
+
+def test_replay_buffer_flush_wraps_around():
+    buffer_size = 8
+    memory = ReplayBuffer(STATE_SIZE, ACTION_SIZE, buffer_size, batch_size=4, seed=0)
+    assert len(memory.pending[0]) == buffer_size
+
+    def add(k):
+        memory.add(np.full(STATE_SIZE, k), np.zeros(ACTION_SIZE), k, np.full(STATE_SIZE, k + 1), False)
+
+    for k in range(3):
+        add(k)
+    memory.flush()
+    assert (memory.ptr, memory.size, len(memory)) == (3, 3, 3)
+
+    # 7 more rows than the 5 left before the end of the ring: the last two wrap to the start
+    for k in range(3, 10):
+        add(k)
+    assert len(memory) == buffer_size
+    memory.flush()
+    assert (memory.ptr, memory.size, len(memory)) == (2, buffer_size, buffer_size)
+    assert memory.rewards.flatten().tolist() == [8, 9, 2, 3, 4, 5, 6, 7]
+    assert memory.states[:, 0].tolist() == [8, 9, 2, 3, 4, 5, 6, 7]
+    assert memory.next_states[:, 0].tolist() == [9, 10, 3, 4, 5, 6, 7, 8]
+
+    # Staging more rows than the ring holds still flushes
+    for k in range(10, 10 + 2 * buffer_size):
+        add(k)
+    memory.flush()
+    assert len(memory) == buffer_size